@@ -1,8 +1,173 @@
+import atexit
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import functools
+import json
+import os
 import random
 import pygame
 import sys
+import threading
 import time
 
+FILL_STRATEGIES = ("backtrack", "pattern", "search") #ways SudokuGenerator.fill_values can build a solution
+
+
+class Variant:
+    """The constraints of a sudoku variant, stored as data so a new variant doesn't need new checking code.
+
+    Every constraint is a unit, a group of cells that must all hold different digits. Rows and columns are always units,
+    then the boxes (or jigsaw regions), the two diagonals for X-Sudoku, and finally the killer cages.
+    Killer cages also have a total their digits must add up to.
+    The unit and peer tables are built once in the constructor and shared by every generator and board using the variant.
+
+    Attributes:
+        name (str): name of the variant, for display.
+
+        row_length (int): the length and width of the board.
+
+        units (tuple[tuple[tuple[int, int], ...], ...]): the (row, col) cells of every unit.
+
+        cages (tuple[tuple[tuple[tuple[int, int], ...], int], ...]): the cells and total of every killer cage.
+
+        cell_units (tuple[tuple[int, ...], ...]): indices into `units` for each cell, indexed by `row*row_length + col`.
+
+        cell_cages (tuple[tuple[int, ...], ...]): indices into `cages` for each cell, indexed the same way.
+
+        peers (tuple[tuple[tuple[int, int], ...], ...]): the cells sharing at least one unit with each cell, indexed the same way.
+
+        is_classic (bool): `True` if this is plain sudoku (square boxes, no diagonals or cages).
+    """
+
+    def __init__(self, row_length: int, name: str = "classic", regions: list = None, diagonals: bool = False, cages: list = ()) -> None:
+        """Builds the unit and peer tables.
+
+        Args:
+            row_length (int): the length and width of the board.
+            name (str): name of the variant. Defaults to "classic".
+            regions (list[list[tuple[int, int]]]): jigsaw regions replacing the square boxes. Must split the board into `row_length` regions of `row_length` cells.
+            diagonals (bool): `True` to add both main diagonals as units (X-Sudoku).
+            cages (list[tuple[list[tuple[int, int]], int]]): killer cages as (cells, total).
+
+        Raises:
+            ValueError: if the regions don't split the board evenly, or a cage total can't be reached.
+        """
+        self.name = name
+        self.row_length = row_length
+        box_length = int(row_length**0.5)
+        cells = [(row, col) for row in range(row_length) for col in range(row_length)]
+
+        self.is_classic = regions is None and not diagonals and not cages
+        if regions is None:
+            if box_length*box_length != row_length:
+                raise ValueError(f"row_length {row_length} has no square boxes, pass jigsaw regions instead")
+            regions = [[(row, col) for row in range(row_start, row_start+box_length) for col in range(col_start, col_start+box_length)]
+                       for row_start in range(0, row_length, box_length) for col_start in range(0, row_length, box_length)]
+        elif sorted(cell for region in regions for cell in region) != cells or any(len(region) != row_length for region in regions):
+            raise ValueError("jigsaw regions must split the board into row_length regions of row_length cells")
+
+        units = [[(row, col) for col in range(row_length)] for row in range(row_length)]
+        units += [[(row, col) for row in range(row_length)] for col in range(row_length)]
+        units += regions
+        if diagonals:
+            units.append([(i, i) for i in range(row_length)])
+            units.append([(i, row_length-1-i) for i in range(row_length)])
+        for cage_cells, total in cages:
+            count = len(cage_cells)
+            if not count*(count+1)//2 <= total <= count*(2*row_length-count+1)//2:
+                raise ValueError(f"cage {cage_cells} can never add up to {total}")
+            units.append(list(cage_cells))
+
+        self.units = tuple(tuple(unit) for unit in units)
+        self.cages = tuple((tuple(cage_cells), total) for cage_cells, total in cages)
+
+        cell_units = [[] for cell in cells]
+        for index, unit in enumerate(self.units):
+            for row, col in unit:
+                cell_units[row*row_length + col].append(index)
+        cell_cages = [[] for cell in cells]
+        for index, (cage_cells, total) in enumerate(self.cages):
+            for row, col in cage_cells:
+                cell_cages[row*row_length + col].append(index)
+        self.cell_units = tuple(tuple(indices) for indices in cell_units)
+        self.cell_cages = tuple(tuple(indices) for indices in cell_cages)
+
+        peers = []
+        for row, col in cells:
+            shared = {cell for index in self.cell_units[row*row_length + col] for cell in self.units[index]}
+            shared.discard((row, col))
+            peers.append(tuple(sorted(shared)))
+        self.peers = tuple(peers)
+
+
+    def is_valid(self, board: list[list[int]], row: int, col: int, num: int) -> bool:
+        """Checks if `num` can go at [`row`,`col`] without breaking any unit or cage.
+
+        Args:
+            board (list[list[int]]): the board to check against, 0 for empty cells.
+            row (int): row of the position to check.
+            col (int): column of the position to check.
+            num (int): number to check for validity.
+
+        Returns:
+            bool: `True` if the value is valid, `False` if it is not valid.
+        """
+        if board[row][col] == num:
+            return False
+        for peer_row, peer_col in self.peers[row*self.row_length + col]:
+            if board[peer_row][peer_col] == num:
+                return False
+        for index in self.cell_cages[row*self.row_length + col]:
+            cage_cells, total = self.cages[index]
+            values = [board[cage_row][cage_col] for cage_row, cage_col in cage_cells if (cage_row, cage_col) != (row, col)]
+            filled = sum(values) + num
+            if filled > total or (0 not in values and filled != total):
+                return False
+        return True
+
+
+    def conflicts(self, board: list[list[int]]) -> list[tuple[int, int]]:
+        """Finds every cell that is empty, holds a value outside 1..row_length, repeats a digit within a unit, or sits in a cage with the wrong total.
+
+        Args:
+            board (list[list[int]]): the board to check.
+
+        Returns:
+            list[tuple[int, int]]: the (row, col) of every conflicting cell, in row-major order. Empty if the board is solved.
+        """
+        bad = {(row, col) for row in range(self.row_length) for col in range(self.row_length) if not 1 <= board[row][col] <= self.row_length}
+        for unit in self.units:
+            seen = {}
+            for row, col in unit:
+                value = board[row][col]
+                if value != 0 and value in seen:
+                    bad.add((row, col))
+                    bad.add(seen[value])
+                seen[value] = (row, col)
+        for cage_cells, total in self.cages:
+            if sum(board[row][col] for row, col in cage_cells) != total:
+                bad.update(cage_cells)
+        return sorted(bad)
+
+
+    def check(self, board: list[list[int]]) -> bool:
+        """Returns `True` if the board is completely and correctly filled."""
+        return not self.conflicts(board)
+
+
+@functools.lru_cache(maxsize=None)
+def classic_variant(row_length: int) -> Variant:
+    """Returns the shared classic variant for boards of this size."""
+    return Variant(row_length)
+
+
+@functools.lru_cache(maxsize=None)
+def x_variant(row_length: int) -> Variant:
+    """Returns the shared X-Sudoku variant (classic plus both main diagonals) for boards of this size."""
+    return Variant(row_length, name="x", diagonals=True)
+
 # Joseph Robinson, 4/9/2024, generator for backend of sudoku game project.
 class SudokuGenerator:
     """A class with methods related to sudoku Generation
@@ -15,20 +180,42 @@ class SudokuGenerator:
         board (list[list[int]]): A 2d matrix containing the values representing the board.
 
         box_length (int): An integer representing the length of each box. This is always the square root of row_length.
+
+        strategy (str): How `fill_values` builds the solved board. One of `FILL_STRATEGIES`.
+
+        variant (Variant): The constraints the board has to satisfy.
+
+        deadline (float): `time.perf_counter()` value after which `fill_search` gives up with a `TimeoutError`. `None` for no limit.
     """    
 
-    def __init__(self, row_length: int, removed_cells: int) -> None:
+    def __init__(self, row_length: int, removed_cells: int, strategy: str = None, variant: Variant = None) -> None:
         """Creates a sudoku board. Initializes the variables and sets up the 2D matrix representation.
 
         Args:
             row_length (int): how many rows and columns will the board have
             removed_cells (int): how many cells will be removed from the board (20,30,50 for easy,medium, and hard)
+            strategy (str): "backtrack" to search for a solution, "pattern" to permute the base pattern, "search" for the
+                variant-aware search. Defaults to "backtrack" for classic boards and "search" for every other variant.
+            variant (Variant): the constraints to generate for. Defaults to the classic variant.
         
         
         """        
+        if variant is None:
+            variant = classic_variant(row_length)
+        if strategy is None:
+            strategy = "backtrack" if variant.is_classic else "search"
+        if strategy not in FILL_STRATEGIES:
+            raise ValueError(f"unknown fill strategy {strategy!r}, expected one of {FILL_STRATEGIES}")
+        if strategy != "search" and not variant.is_classic:
+            raise ValueError(f"the {strategy!r} strategy only works on classic boards, use \"search\" for {variant.name!r}")
+        if variant.row_length != row_length:
+            raise ValueError(f"variant is for {variant.row_length}x{variant.row_length} boards, not {row_length}x{row_length}")
         
         self.row_length = row_length
         self.removed_cells = removed_cells
+        self.strategy = strategy
+        self.variant = variant
+        self.deadline = None
         self.board = []
         self.box_length = int(row_length**0.5)
         for i in range(0, row_length):
@@ -118,15 +305,7 @@ class SudokuGenerator:
         Returns:
             bool: `True` if the value is valid, `False` if it is not valid.
         """        
-        row_start = (row//self.box_length)*self.box_length
-        col_start = (col//self.box_length)*self.box_length
-        if not self.valid_in_box(row_start, col_start, num):
-            return False
-        if not self.valid_in_col(col, num):
-            return False
-        if not self.valid_in_row(row, num):
-            return False
-        return True
+        return self.variant.is_valid(self.board, row, col, num) # checks the precomputed peers instead of scanning the row, column and box
 
     
     def fill_box(self, row_start: int, col_start: int) -> None:
@@ -197,19 +376,154 @@ class SudokuGenerator:
 
     def fill_values(self) -> None:
         """
-        DO NOT CHANGE
-        Provided for students
-        Constructs a solution by calling fill_diagonal and fill_remaining
+        Constructs a solution with the generator's strategy.
+        No longer the version provided for students, which only did the "backtrack" branch:
+        "backtrack" calls fill_diagonal and fill_remaining as before, "pattern" calls fill_pattern, "search" calls fill_search.
         """
+        if self.strategy == "pattern":
+            self.fill_pattern()
+            return
+        if self.strategy == "search":
+            if not self.fill_search():
+                raise ValueError(f"the {self.variant.name!r} variant has no solution, check its regions and cage totals")
+            return
         
         self.fill_diagonal()
         self.fill_remaining(0, self.box_length)
+
+
+    def fill_pattern(self) -> None:
+        """Fills the whole board from the shifted base pattern, then shuffles it. No backtracking, so it is fast at any size.
+
+        Row `r` of the base pattern is row 0 shifted by `box_length*(r%box_length) + r//box_length`, which is always a valid solution.
+        Rows are then shuffled within their band, bands are shuffled, columns within their stack, stacks, and finally the digits.
+        Every one of those permutations keeps the board valid.
+        """
+        box = self.box_length
+        side = self.row_length
+        rows = [band*box + row for band in random.sample(range(box), box) for row in random.sample(range(box), box)]
+        cols = [stack*box + col for stack in random.sample(range(box), box) for col in random.sample(range(box), box)]
+        digits = random.sample(range(1, side+1), side)
+        for i, row in enumerate(rows):
+            shift = box*(row%box) + row//box
+            self.board[i] = [digits[(shift + col) % side] for col in cols]
+        return
         
 
 
+    def fill_search(self) -> bool:
+        """Fills the empty cells by randomized backtracking that works for any variant.
+
+        Keeps a bitmask of the digits used in every unit, so a cell's candidates are a few mask operations,
+        and always fills the cell with the fewest candidates next. Cages are pruned on their running totals.
+        A few bad early guesses can make the search take exponentially long, so it restarts from the starting board
+        whenever it runs past a node budget, doubling the budget each time.
+
+        Returns:
+            bool: `True` if the board could be filled, `False` if it has no solution.
+        """
+        variant = self.variant
+        side = self.row_length
+        full = (1 << side) - 1
+        cell_units = variant.cell_units
+        cell_cages = variant.cell_cages
+        cages = variant.cages
+        start = [row[:] for row in self.board]
+
+        def candidates(index: int) -> int:
+            mask = full
+            for unit in cell_units[index]:
+                mask &= ~used[unit]
+            for cage in cell_cages[index]:
+                remaining = cages[cage][1] - cage_sum[cage]
+                if cage_left[cage] == 1:
+                    mask &= (1 << (remaining-1)) if 0 < remaining <= side else 0
+                else: # the other empty cells in the cage need at least 1 each
+                    mask &= (1 << max(0, min(side, remaining - (cage_left[cage]-1)))) - 1
+            return mask
+
+        def place(index: int, value: int, sign: int) -> None:
+            bit = 1 << (value-1)
+            for unit in cell_units[index]:
+                used[unit] ^= bit
+            for cage in cell_cages[index]:
+                cage_sum[cage] += sign*value
+                cage_left[cage] -= sign
+            self.board[index//side][index % side] = value if sign > 0 else 0
+
+        def search():
+            # True if solved, False if there is no solution from here, None if the node budget ran out
+            nonlocal nodes
+            if not empty:
+                return True
+            nodes += 1
+            if nodes > budget:
+                return None
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise TimeoutError
+            best, best_mask, best_count = 0, 0, side+1
+            for position, index in enumerate(empty):
+                mask = candidates(index)
+                count = bin(mask).count("1")
+                if count < best_count:
+                    best, best_mask, best_count = position, mask, count
+                    if count <= 1:
+                        break
+            if best_count == 0:
+                return False
+            index = empty[best]
+            empty[best] = empty[-1]
+            empty.pop()
+            values = [value for value in range(1, side+1) if best_mask >> (value-1) & 1]
+            random.shuffle(values)
+            for value in values:
+                place(index, value, 1)
+                result = search()
+                if result is not False:
+                    return result # solved, or out of budget and about to restart anyway
+                place(index, value, -1)
+            empty.append(index)
+            empty[best], empty[-1] = empty[-1], empty[best]
+            return False
+
+        old_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(old_limit + side*side) # search() recurses once per empty cell, 1296 deep on a 36x36 board
+        try:
+            budget = 4*side*side
+            while True:
+                self.board[:] = [row[:] for row in start]
+                used = [0]*len(variant.units)
+                cage_sum = [0]*len(cages)
+                cage_left = [len(cage_cells) for cage_cells, total in cages]
+                empty = []
+                for index in range(side*side):
+                    value = start[index//side][index % side]
+                    if value == 0:
+                        empty.append(index)
+                    else:
+                        bit = 1 << (value-1)
+                        for unit in cell_units[index]:
+                            used[unit] |= bit
+                        for cage in cell_cages[index]:
+                            cage_sum[cage] += value
+                            cage_left[cage] -= 1
+                nodes = 0
+                result = search()
+                if result is not None:
+                    return result
+                budget *= 2
+        finally:
+            sys.setrecursionlimit(old_limit)
+
+
     def remove_cells(self) -> None:
         """Removes the appropriate amount of cells (self.removed_cells) from the board by setting their value to `0`. Called after board is filled.
+
+        Raises:
+            ValueError: if `removed_cells` is more than the cells it can pick from. Row 0 and column 0 are never removed.
         """
+        if not 0 <= self.removed_cells <= (self.row_length-1)**2:
+            raise ValueError(f"can remove between 0 and {(self.row_length-1)**2} cells from a {self.row_length}x{self.row_length} board, not {self.removed_cells}")
         count = 0
         while count < self.removed_cells:
             rand_row = random.randint(1,self.row_length-1)
@@ -244,6 +558,422 @@ def generate_sudoku(size:int, removed:int) -> list[list[int]]:
     return board # function description incorrect, this only returns the unsolved board. - Joseph
 
 
+def mixing_statistics(size: int = 9, samples: int = 1000, strategy: str = "pattern", batches: int = 20) -> dict:
+    """Measures how well mixed the generated solutions are.
+
+    Two chi-square statistics, each computed separately on `batches` independent batches of boards:
+    - digit: which digit lands in each cell. Catches missing digit relabelling.
+    - pair: for every pair of cells in different bands and different stacks, how often both hold the same digit.
+      A generator that shuffles rows within bands and columns within stacks makes all those pairs equally likely
+      ((box_length-1)**2 out of (row_length-box_length)**2), whatever the digit labels are, so this measures the structural shuffles.
+    Each count on its own is binomial, so a well mixed generator gives a chi-square whose mean is exactly its degrees of freedom.
+    The counts are correlated with each other though (they share rows, columns and digits), so the spread is measured
+    from the batches instead of assumed. "digit_t" and "pair_t" are one-sample t statistics of the batch chi-squares
+    against their degrees of freedom, with `batches`-1 degrees of freedom. Both are near 0 for a well mixed generator,
+    and large and positive when some digits or pairs come up more often than they should.
+    Also reports the fraction of distinct boards after relabelling every board so row 0 reads 1..row_length.
+
+    Args:
+        size (int): row length of the boards to generate.
+        samples (int): how many boards to generate. Split evenly into the batches.
+        strategy (str): fill strategy to check.
+        batches (int): how many independent batches to split the boards into. At least 2.
+
+    Returns:
+        dict: "digit_t", "pair_t" and "unique_fraction".
+    """
+    box = int(size**0.5)
+    cells = size*size
+    per_batch = samples//batches
+    pairs = [(a, b) for a in range(cells) for b in range(a+1, cells)
+             if a//size//box != b//size//box and a%size//box != b%size//box]
+    p = (box-1)**2/(size-box)**2
+    digit_chis = []
+    pair_chis = []
+    seen = set()
+    for batch in range(batches):
+        digit_counts = [[0]*size for cell in range(cells)]
+        pair_counts = [0]*len(pairs)
+        for k in range(per_batch):
+            sudoku = SudokuGenerator(size, 0, strategy)
+            sudoku.fill_values()
+            flat = [value for row in sudoku.get_board() for value in row]
+            for cell, value in enumerate(flat):
+                digit_counts[cell][value-1] += 1
+            for index, (a, b) in enumerate(pairs):
+                if flat[a] == flat[b]:
+                    pair_counts[index] += 1
+            labels = {value: i+1 for i, value in enumerate(flat[:size])}
+            seen.add(tuple(labels[value] for value in flat))
+        expected = per_batch/size
+        digit_chis.append(sum((observed-expected)**2/expected for counts in digit_counts for observed in counts))
+        expected = per_batch*p
+        pair_chis.append(sum((observed-expected)**2/(expected*(1-p)) for observed in pair_counts))
+
+    def t_score(chis: list[float], dof: int) -> float:
+        mean = sum(chis)/len(chis)
+        spread = (sum((chi-mean)**2 for chi in chis)/(len(chis)-1))**0.5
+        return (mean-dof)/(spread/len(chis)**0.5) if spread else float("inf")
+
+    return {
+        "digit_t": t_score(digit_chis, cells*(size-1)),
+        "pair_t": t_score(pair_chis, len(pairs)),
+        "unique_fraction": len(seen)/(per_batch*batches),
+    }
+
+
+def check_mixing(size: int = 9, samples: int = 1000, strategy: str = "pattern", seed: int = 2024, max_t: float = 6.0, min_unique: float = 0.9) -> dict:
+    """Runs `mixing_statistics` with a fixed seed and fails if the boards aren't well mixed.
+
+    Only large positive t statistics fail, since being too even isn't a mixing problem. The batch chi-squares are
+    skewed to the right, which makes very negative t values more common than the t distribution says but positive
+    ones rarer, so the one-sided bound is the trustworthy one. With the default 20 batches the t distribution puts a
+    correct generator past `max_t` = 6 for about 1 seed in 200,000. Dropping the row shuffles gives a pair t of
+    over 10, and dropping the column shuffles or digit relabelling gives far more.
+
+    Args:
+        size (int): row length of the boards to generate.
+        samples (int): how many boards to generate.
+        strategy (str): fill strategy to check.
+        seed (int): random seed, restored afterwards so the check doesn't disturb other callers.
+        max_t (float): largest allowed t statistic.
+        min_unique (float): smallest allowed fraction of distinct relabelled boards.
+
+    Raises:
+        AssertionError: if either t statistic is above `max_t` or the unique fraction is below `min_unique`.
+
+    Returns:
+        dict: the statistics from `mixing_statistics`.
+    """
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        stats = mixing_statistics(size, samples, strategy)
+    finally:
+        random.setstate(state)
+    if stats["digit_t"] > max_t:
+        raise AssertionError(f"digits are not evenly spread over the cells: {stats}")
+    if stats["pair_t"] > max_t:
+        raise AssertionError(f"rows or columns are not shuffled: {stats}")
+    if stats["unique_fraction"] < min_unique:
+        raise AssertionError(f"too many boards differ only by digit labels: {stats}")
+    return stats
+
+
+def benchmark_fill_strategies(sizes: tuple = (9, 16, 25, 36), trials: int = 5, time_limit: float = 10.0) -> dict:
+    """Times `fill_values` for every strategy at each board size.
+
+    The search strategies blow up on big boards, so each attempt is cut off after `time_limit` seconds
+    and reported as `None` instead of hanging the benchmark.
+
+    Args:
+        sizes (tuple): row lengths to benchmark. Must be perfect squares.
+        trials (int): boards to generate per size and strategy. The average is reported.
+        time_limit (float): seconds before an attempt is abandoned.
+
+    Returns:
+        dict: {size: {strategy: average seconds per board, or None if it timed out}}
+    """
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, 4*max(sizes)**2)) # fill_remaining recurses once per cell
+    results = {}
+    try:
+        for size in sizes:
+            results[size] = {}
+            for strategy in FILL_STRATEGIES:
+                total = 0.0
+                for k in range(trials):
+                    sudoku = SudokuGenerator(size, 0, strategy)
+                    deadline = time.perf_counter() + time_limit
+                    sudoku.deadline = deadline # fill_search checks this itself, the backtracker needs is_valid wrapped
+                    check = sudoku.is_valid
+                    def timed_is_valid(row, col, num, check=check, deadline=deadline):
+                        if time.perf_counter() > deadline:
+                            raise TimeoutError
+                        return check(row, col, num)
+                    sudoku.is_valid = timed_is_valid
+                    start = time.perf_counter()
+                    try:
+                        sudoku.fill_values()
+                    except TimeoutError:
+                        total = None
+                        break
+                    total += time.perf_counter() - start
+                results[size][strategy] = None if total is None else total/trials
+    finally:
+        sys.setrecursionlimit(old_limit)
+    return results
+
+
+Verdict = collections.namedtuple("Verdict", ["valid", "conflicts"]) #result of verifying one board, conflicts is a tuple of (row, col)
+
+
+VERIFY_VARIANT = None #the variant a verification worker process checks against, set once per process by verify_worker_init
+
+
+def verify_worker_init(variant: Variant) -> None:
+    """Runs once in every verification worker process, so the variant is only sent to each worker once.
+
+    Args:
+        variant (Variant): the rules to verify against.
+    """
+    global VERIFY_VARIANT
+    VERIFY_VARIANT = variant
+
+
+def verify_chunk(keys: list[bytes]) -> list[Verdict]:
+    """Verifies packed boards against the worker's variant. Runs in the verification worker processes.
+
+    Args:
+        keys (list[bytes]): boards packed by `pack_board`.
+
+    Returns:
+        list[Verdict]: one verdict per board, in the same order.
+    """
+    return verify_packed(VERIFY_VARIANT, keys)
+
+
+def verify_packed(variant: Variant, keys: list[bytes]) -> list[Verdict]:
+    """Verifies packed boards against a variant.
+
+    Args:
+        variant (Variant): the rules to verify against.
+        keys (list[bytes]): boards packed by `pack_board`.
+
+    Returns:
+        list[Verdict]: one verdict per board, in the same order.
+    """
+    side = variant.row_length
+    verdicts = []
+    for key in keys:
+        board = [list(key[row*side:(row+1)*side]) for row in range(side)]
+        conflicts = tuple(variant.conflicts(board))
+        verdicts.append(Verdict(not conflicts, conflicts))
+    return verdicts
+
+
+def pack_board(board: list[list[int]]) -> bytes:
+    """Packs a board into one byte per cell, row by row. Equal boards always pack to equal bytes, so the result works as a cache key.
+
+    Args:
+        board (list[list[int]]): the board to pack. Values must be between 0 and 255.
+
+    Returns:
+        bytes: the packed board.
+    """
+    return bytes(value for row in board for value in row)
+
+
+class VerdictCache:
+    """A thread-safe LRU cache from packed boards to their `Verdict`.
+
+    Attributes:
+        max_size (int): how many verdicts to keep before the least recently used one is evicted.
+
+        hits (int): lookups that found a verdict.
+
+        misses (int): lookups that didn't.
+    """
+
+    def __init__(self, max_size: int = 10000) -> None:
+        """Creates an empty cache.
+
+        Args:
+            max_size (int): how many verdicts to keep. Defaults to 10000.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def get(self, key: bytes) -> Verdict:
+        """Looks up a verdict and marks it as recently used.
+
+        Args:
+            key (bytes): the packed board.
+
+        Returns:
+            Verdict: the cached verdict, or `None` if the board hasn't been verified (or was evicted).
+        """
+        with self.lock:
+            verdict = self.entries.get(key)
+            if verdict is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+
+    def put(self, key: bytes, verdict: Verdict) -> None:
+        """Stores a verdict, evicting the least recently used ones if the cache is full.
+
+        Args:
+            key (bytes): the packed board.
+            verdict (Verdict): the verdict to store.
+        """
+        with self.lock:
+            self.entries[key] = verdict
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+    def hit_rate(self) -> float:
+        """Returns the fraction of lookups that were hits, `0.0` before the first lookup."""
+        with self.lock:
+            total = self.hits + self.misses
+            return self.hits/total if total else 0.0
+
+
+class VerificationService:
+    """Verifies batches of submitted boards, caching every verdict.
+
+    Identical boards within a batch are only verified once, and boards already in the cache aren't verified at all.
+    By default boards are verified in the calling process. Verification is pure Python, so threads wouldn't help,
+    but `workers` > 0 starts a pool of worker processes that get the variant once, when they start, and receive packed boards.
+    Sending a 9x9 board to a worker costs about as much as verifying it, so the pool only pays off with several free
+    cores and big batches, or with big variants where each board takes much longer to check than to send.
+    The service itself can be shared by several threads.
+
+    Attributes:
+        variant (Variant): the rules boards are verified against.
+
+        cache (VerdictCache): verdicts of previously verified boards.
+
+        chunk_size (int): how many boards each pool task verifies, so small boards don't drown in task overhead.
+
+        pool (concurrent.futures.ProcessPoolExecutor): the worker processes, `None` when verifying in-process.
+
+        verified (int): boards actually verified (cache misses after deduplication).
+
+        deduplicated (int): submissions answered by an identical board earlier in the same batch, without a cache lookup.
+
+        verify_seconds (float): wall time spent waiting on the worker processes.
+    """
+
+    def __init__(self, variant: Variant = None, cache_size: int = 10000, workers: int = 0, chunk_size: int = 64) -> None:
+        """Sets up the cache, and the worker pool if there is one.
+
+        Args:
+            variant (Variant): the rules to verify against. Defaults to classic 9x9 sudoku.
+            cache_size (int): how many verdicts to keep. Defaults to 10000.
+            workers (int): how many worker processes to run. Defaults to 0, which verifies in the calling process.
+            chunk_size (int): boards per pool task. Defaults to 64.
+        """
+        self.variant = variant if variant is not None else classic_variant(9)
+        self.cache = VerdictCache(cache_size)
+        self.chunk_size = chunk_size
+        self.pool = None
+        if workers > 0:
+            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=verify_worker_init, initargs=(self.variant,))
+        self.verified = 0
+        self.deduplicated = 0
+        self.verify_seconds = 0.0
+        self.lock = threading.Lock()
+
+
+    def verify_batch(self, boards: list[list[list[int]]]) -> list[Verdict]:
+        """Verifies a batch of submitted boards.
+
+        Args:
+            boards (list[list[list[int]]]): the submitted boards, 0 for empty cells.
+
+        Raises:
+            ValueError: if a board isn't the size of the service's variant, or holds something other than a whole number from 0 to 255.
+                In-range values that aren't digits of the variant (like 10 on a 9x9 board) are reported as conflicts instead.
+
+        Returns:
+            list[Verdict]: one verdict per submitted board, in the same order.
+        """
+        side = self.variant.row_length
+        keys = []
+        for board in boards:
+            if len(board) != side or any(len(row) != side for row in board):
+                raise ValueError(f"expected a {side}x{side} board")
+            for row in board:
+                for value in row:
+                    if not isinstance(value, int) or not 0 <= value <= 255:
+                        raise ValueError(f"cell values must be whole numbers from 0 to 255, not {value!r}")
+            keys.append(pack_board(board))
+
+        verdicts = {}
+        missing = [] #packed boards to verify, each only once even if it was submitted several times
+        repeats = 0
+        for key in keys:
+            if key in verdicts:
+                repeats += 1
+                continue
+            verdict = self.cache.get(key)
+            verdicts[key] = verdict
+            if verdict is None:
+                missing.append(key)
+
+        if missing:
+            start = time.perf_counter()
+            if self.pool is None:
+                results = verify_packed(self.variant, missing)
+            else:
+                chunks = [missing[i:i+self.chunk_size] for i in range(0, len(missing), self.chunk_size)]
+                futures = [self.pool.submit(verify_chunk, chunk) for chunk in chunks]
+                results = [verdict for future in futures for verdict in future.result()]
+            for key, verdict in zip(missing, results):
+                verdicts[key] = verdict
+                self.cache.put(key, verdict)
+            elapsed = time.perf_counter() - start
+        with self.lock:
+            self.deduplicated += repeats
+            if missing:
+                self.verified += len(missing)
+                self.verify_seconds += elapsed
+
+        return [verdicts[key] for key in keys]
+
+
+    def verify(self, board: list[list[int]]) -> Verdict:
+        """Verifies a single board. See `verify_batch`."""
+        return self.verify_batch([board])[0]
+
+
+    def stats(self) -> dict:
+        """Reports how much work the cache and deduplication saved, and how fast the rest was verified.
+
+        Returns:
+            dict: "hit_rate", "hits", "misses", "deduplicated", "saved_rate" (fraction of all submissions that weren't verified),
+                "cached", "verified" and "boards_per_second" (verification throughput).
+        """
+        with self.lock:
+            verified, seconds, deduplicated = self.verified, self.verify_seconds, self.deduplicated
+        hits, misses = self.cache.hits, self.cache.misses
+        submitted = hits + misses + deduplicated
+        return {
+            "hit_rate": self.cache.hit_rate(),
+            "hits": hits,
+            "misses": misses,
+            "deduplicated": deduplicated,
+            "saved_rate": (hits + deduplicated)/submitted if submitted else 0.0,
+            "cached": len(self.cache.entries),
+            "verified": verified,
+            "boards_per_second": verified/seconds if seconds else 0.0,
+        }
+
+
+    def close(self) -> None:
+        """Stops the worker pool, if there is one, once running tasks finish."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+
+    def __enter__(self) -> "VerificationService":
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
 #Visual stuff starts Justice Benton did this too
 #These are globals. Do not modify unless necessary. 
 BG_COLOR = "black" #global background color (and text on button color)
@@ -255,6 +985,378 @@ OUTER_BD_THICK = 15 #global sudoku outer-boundary thickness (in pixels). Like, t
 INNER_BD_THICK = 9 #global sudoku gridline thickness (in pixels)
 SIZE = 9 #the size (row length in cells) of the sudoku game
 cell_size = (HEIGHT-4*OUTER_BD_THICK-6*INNER_BD_THICK)/9 #the pixel width of the cells
+PERF_HUD_KEY = pygame.K_F3 #toggles the performance HUD
+PERF_DUMP_KEY = pygame.K_F4 #dumps the performance ring buffers to csv files
+PERF_BUFFER_SIZE = 10000 #how many frame samples (and input latencies) the ring buffers keep
+PERF_HUD_INTERVAL = 0.25 #seconds between HUD redraws, so the HUD doesn't cause the stutter it's measuring
+
+
+#Performance instrumentation
+class PerfMonitor:
+    #Records per-frame timings into a ring buffer and optionally shows them in a HUD on the side panel.
+    #A frame is one pass of a game loop that did work (handled an input, drew or presented). Its time is split into
+    #draw (Cell.draw/Board.draw), present (pygame.display.update), sleep (the stability buffers in main) and logic (everything else).
+    #The game loops aren't paced, so passes that did nothing are only counted and timed, and folded into the next real frame.
+    #Input latency is measured from when an input event is pulled off the queue to the present in the same frame, and every
+    #input's latency goes into its own buffer so idle frames can't push it out. Inputs that didn't lead to a present in their
+    #frame (clicking empty space, keys with no cell selected) are recorded with no latency, instead of waiting for a later
+    #present and soaking up however long the player paused.
+    CSV_HEADER = ("frame", "start_s", "frame_ms", "logic_ms", "draw_ms", "present_ms", "sleep_ms", "inputs", "max_input_latency_ms", "idle_passes", "idle_ms")
+    INPUT_CSV_HEADER = ("input", "queued_s", "latency_ms") #latency_ms is blank for inputs that didn't present anything
+
+    def __init__(self, capacity=PERF_BUFFER_SIZE):
+        self.samples = collections.deque(maxlen=capacity) #rolling buffer, old frames fall off the front
+        self.latencies = collections.deque(maxlen=capacity) #(queued_s, latency_ms) of every input, latency_ms is None if it never presented
+        self.present_times = collections.deque(maxlen=1000) #when recent presents happened, for the presents-per-second figure
+        self.visible = False
+        self.frame_count = 0
+        self.input_count = 0
+        self.pending_inputs = [] #queue times of inputs that haven't been presented yet
+        self.depth = collections.Counter() #nesting depth per section, so Board.draw calling Cell.draw isn't counted twice
+        self.hud_font = None
+        self.last_hud = 0.0
+        self.message = "" #last line of the HUD, the file name of the last csv dump
+        self.presents = 0 #full display updates since startup
+        self.skip_sleep = False #replays turn the stability sleeps off to run as fast as possible
+        self.idle_passes = 0
+        self.idle_time = 0.0
+        self.begin_frame()
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+        self.times = collections.Counter() #seconds spent per section this frame
+        self.inputs = 0
+        self.max_latency = 0.0
+
+    def mark_input(self):
+        #call as soon as an input event comes off the queue
+        self.pending_inputs.append(time.perf_counter())
+        self.inputs += 1
+
+    @contextlib.contextmanager
+    def timing(self, section):
+        self.depth[section] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.depth[section] -= 1
+            if self.depth[section] == 0:
+                self.times[section] += time.perf_counter() - start
+
+    def present(self):
+        #replacement for pygame.display.update() that also closes out any pending input latencies
+        with self.timing("present"):
+            pygame.display.update()
+        self.presents += 1
+        now = time.perf_counter()
+        self.present_times.append(now)
+        for queued in self.pending_inputs:
+            self.max_latency = max(self.max_latency, now - queued)
+            self.latencies.append((queued, (now - queued)*1000))
+            self.input_count += 1
+        self.pending_inputs.clear()
+
+    def sleep(self, seconds):
+        #replacement for time.sleep() so sleeping shows up separately from logic
+        if self.skip_sleep:
+            return
+        with self.timing("sleep"):
+            time.sleep(seconds)
+
+    def end_frame(self):
+        now = time.perf_counter()
+        total = now - self.frame_start
+        if self.inputs or self.times:
+            draw, present, sleep = self.times["draw"], self.times["present"], self.times["sleep"]
+            self.samples.append((self.frame_count, self.frame_start, total*1000, (total-draw-present-sleep)*1000,
+                                 draw*1000, present*1000, sleep*1000, self.inputs, self.max_latency*1000,
+                                 self.idle_passes, self.idle_time*1000))
+            self.frame_count += 1
+            self.idle_passes = 0
+            self.idle_time = 0.0
+        else: #an idle pass of the busy loop
+            self.idle_passes += 1
+            self.idle_time += total
+        for queued in self.pending_inputs: #handled without a present, so there's no latency to charge them with
+            self.latencies.append((queued, None))
+            self.input_count += 1
+        self.pending_inputs.clear()
+        if self.visible and now - self.last_hud >= PERF_HUD_INTERVAL:
+            self.draw_hud()
+            self.last_hud = now
+        self.begin_frame()
+
+    def summary(self, frames=60, inputs=20):
+        #averages over the last `frames` working frames, latencies over the last `inputs` inputs
+        recent = list(self.samples)[-frames:]
+        latencies = [latency for queued, latency in list(self.latencies)[-inputs:] if latency is not None]
+        now = time.perf_counter()
+        stats = {
+            "fps": sum(1 for presented in self.present_times if now - presented <= 1.0), #full presents in the last second
+            "frame_ms": 0.0,
+            "logic_ms": 0.0,
+            "draw_ms": 0.0,
+            "latency_ms": latencies[-1] if latencies else 0.0,
+            "latency_max_ms": max(latencies) if latencies else 0.0,
+        }
+        if recent:
+            stats["frame_ms"] = sum(sample[2] for sample in recent)/len(recent)
+            stats["logic_ms"] = sum(sample[3] for sample in recent)/len(recent)
+            stats["draw_ms"] = sum(sample[4] for sample in recent)/len(recent)
+        return stats
+
+    def hud_rect(self):
+        #bottom of the side panel, below the Quit button (which ends around y=473)
+        return pygame.Rect(HEIGHT, HEIGHT*485/600, WIDTH-HEIGHT, HEIGHT*115/600)
+
+    def draw_hud(self):
+        screen = pygame.display.get_surface()
+        if screen is None:
+            return
+        if self.hud_font is None:
+            self.hud_font = pygame.font.Font(None, 20)
+        stats = self.summary()
+        lines = [
+            f"FPS {stats['fps']}  frame {stats['frame_ms']:.2f}ms",
+            f"logic {stats['logic_ms']:.2f}ms  draw {stats['draw_ms']:.2f}ms",
+            f"input {stats['latency_ms']:.1f}ms  max {stats['latency_max_ms']:.1f}ms",
+            self.message,
+        ]
+        rect = self.hud_rect()
+        screen.fill(BG_COLOR, rect)
+        for i, line in enumerate(lines):
+            screen.blit(self.hud_font.render(line, 0, LINE_COLOR), (rect.x+8, rect.y+6+i*22))
+        pygame.display.update(rect) #only the HUD area, so it doesn't count as a full present
+
+    def toggle(self):
+        self.visible = not self.visible
+        if self.visible:
+            self.draw_hud()
+        else:
+            screen = pygame.display.get_surface()
+            if screen is not None:
+                screen.fill(BG_COLOR, self.hud_rect())
+                pygame.display.update(self.hud_rect())
+
+    def dump_csv(self, path=None):
+        #writes every buffered frame to path, and every buffered input latency next to it (name_inputs.csv)
+        #returns both paths, and shows where they went on the HUD
+        if path is None:
+            path = time.strftime("perf_%Y%m%d_%H%M%S.csv")
+        root, ext = os.path.splitext(path)
+        input_path = root + "_inputs" + (ext or ".csv")
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.CSV_HEADER)
+            writer.writerows(self.samples)
+        with open(input_path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.INPUT_CSV_HEADER)
+            first = self.input_count - len(self.latencies)
+            writer.writerows((first+i, queued, latency) for i, (queued, latency) in enumerate(self.latencies))
+        self.message = os.path.basename(path) #just the name, "saved perf_<date>_<time>.csv" is wider than the panel
+        if pygame.display.get_init() and pygame.display.get_surface() is not None:
+            self.visible = True #shows the message
+            self.draw_hud()
+        return path, input_path
+
+
+def perf_timed(section):
+    #decorator that charges a function's run time to a PERF section
+    def wrap(func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with PERF.timing(section):
+                return func(*args, **kwargs)
+        return timed
+    return wrap
+
+
+PERF = PerfMonitor() #global so the buffer survives restarts of main()
+
+
+#Pencil marks
+class CandidateAtlas:
+    #Renders each pencil mark digit once, then builds and caches one surface per combination of marks.
+    #A cell draws all of its marks with a single blit instead of rendering a text surface per digit.
+    def __init__(self, size):
+        self.size = size
+        self.box = int(size**0.5)
+        self.slot = (cell_size-5)/self.box #each digit gets a box x box slot inside the cell
+        font = pygame.font.Font(None, int(self.slot*1.1))
+        self.glyphs = [font.render(str(digit), 0, LINE_COLOR) for digit in range(1, size+1)]
+        self.surfaces = {} #marks bitmask -> finished surface
+
+    def surface(self, marks):
+        surface = self.surfaces.get(marks)
+        if surface is None:
+            surface = pygame.Surface((cell_size-5, cell_size-5))
+            surface.fill(BG_COLOR)
+            for digit in range(self.size):
+                if marks >> digit & 1:
+                    glyph = self.glyphs[digit]
+                    center = ((digit%self.box + 0.5)*self.slot, (digit//self.box + 0.5)*self.slot)
+                    surface.blit(glyph, glyph.get_rect(center=center))
+            self.surfaces[marks] = surface
+        return surface
+
+
+@functools.lru_cache(maxsize=None)
+def candidate_atlas(size):
+    #one atlas per board size, built on first use because fonts need pygame.init()
+    return CandidateAtlas(size)
+
+
+MARK_KEYS = {getattr(pygame, f"K_{digit}"): digit for digit in range(1, 10)}
+MARK_KEYS.update({getattr(pygame, f"K_KP{digit}"): digit for digit in range(1, 10)}) #Shift + one of these toggles a pencil mark
+
+
+#Input recording and replay
+RECORDED_EVENTS = (pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN) #the only event types the game loops react to
+
+
+class ReplayFinished(Exception):
+    #raised by EventReplayer.get when the recording runs out, to break out of the game loops
+    pass
+
+
+class EventSource:
+    #Where the game loops get their input from. This one passes straight through to pygame.
+    def get(self):
+        return pygame.event.get()
+
+    def get_pressed(self):
+        return pygame.key.get_pressed()
+
+
+class EventRecorder(EventSource):
+    #Passes events through like EventSource, but also writes them to a json-lines file.
+    #The first line holds the random seed, every other line is one batch of events from one call to get().
+    def __init__(self, path, seed=None):
+        if seed is None:
+            seed = random.randrange(2**32)
+        random.seed(seed) #the seed is what makes the generated boards replay identically
+        self.file = open(path, "w")
+        self.file.write(json.dumps({"seed": seed}) + "\n")
+        self.file.flush()
+
+    def get(self):
+        events = pygame.event.get()
+        batch = []
+        for event in events:
+            if event.type in RECORDED_EVENTS:
+                attrs = {key: value for key, value in event.dict.items() if key != "window"} #window handles can't be saved
+                batch.append({"type": event.type, "name": pygame.event.event_name(event.type), "attrs": attrs})
+        if batch:
+            self.file.write(json.dumps({"batch": batch}) + "\n")
+            self.file.flush() #the game usually ends with sys.exit, so nothing can wait for a close()
+        return events
+
+
+class ReplayKeys:
+    #stand-in for pygame.key.get_pressed() during a replay. Only the key of the event being handled is down.
+    def __init__(self):
+        self.key = None
+
+    def __getitem__(self, key):
+        return key == self.key
+
+
+class EventReplayer(EventSource):
+    #Feeds a recording back to the game loops, one recorded batch per call to get(), with no waiting in between.
+    #Also times how long the game spends handling each event.
+    def __init__(self, path):
+        with open(path) as file:
+            lines = [json.loads(line) for line in file if line.strip()]
+        self.seed = lines[0]["seed"]
+        self.batches = []
+        for line in lines[1:]:
+            batch = []
+            for event in line["batch"]:
+                attrs = event["attrs"]
+                if "pos" in attrs:
+                    attrs["pos"] = tuple(attrs["pos"]) #json turns tuples into lists
+                batch.append(pygame.event.Event(event["type"], attrs))
+            self.batches.append(batch)
+        self.index = 0
+        self.pressed = ReplayKeys()
+        self.costs = [] #(event name, seconds spent handling it)
+        self.active = None #generator for the batch being handled
+
+    def get(self):
+        #one recorded batch per call. The batch is a generator, so each event's handling time runs from its yield until
+        #the game asks for the next event, or until the generator is closed because the game returned or exited mid-batch.
+        self.close()
+        if self.index >= len(self.batches):
+            raise ReplayFinished
+        batch = self.batches[self.index]
+        self.index += 1
+        self.active = self.play(batch)
+        return self.active
+
+    def play(self, batch):
+        for event in batch:
+            if event.type == pygame.KEYDOWN:
+                self.pressed.key = event.key
+            start = time.perf_counter()
+            try:
+                yield event
+            finally:
+                self.costs.append((pygame.event.event_name(event.type), time.perf_counter() - start))
+
+    def close(self):
+        #finishes timing the batch in progress, if any
+        if self.active is not None:
+            self.active.close()
+            self.active = None
+
+    def get_pressed(self):
+        return self.pressed
+
+
+EVENTS = EventSource() #swapped for a recorder or replayer by the command line flags
+
+
+def run_replay(path):
+    #Replays a recording headlessly (SDL dummy video driver) as fast as possible and returns a timing report.
+    global EVENTS
+    old_driver = os.environ.get("SDL_VIDEODRIVER")
+    old_visible = PERF.visible
+    os.environ["SDL_VIDEODRIVER"] = "dummy" #must be set before main() calls pygame.init()
+    replayer = EventReplayer(path)
+    random.seed(replayer.seed)
+    EVENTS = replayer
+    PERF.skip_sleep = True
+    presents = PERF.presents
+    start = time.perf_counter()
+    try:
+        while True:
+            main()
+    except (ReplayFinished, SystemExit): #out of events, or the recording ended with a quit
+        pass
+    finally:
+        replayer.close() #times the event that ended the replay (a quit, or a click that returned)
+        EVENTS = EventSource()
+        PERF.skip_sleep = False
+        PERF.visible = old_visible #a replayed F3 shouldn't leave the HUD on for the caller
+        if old_driver is None:
+            del os.environ["SDL_VIDEODRIVER"]
+        else:
+            os.environ["SDL_VIDEODRIVER"] = old_driver
+    wall = time.perf_counter() - start
+    costs = [cost for name, cost in replayer.costs]
+    by_type = collections.defaultdict(list)
+    for name, cost in replayer.costs:
+        by_type[name].append(cost)
+    return {
+        "wall_s": wall,
+        "events": len(costs),
+        "event_mean_ms": sum(costs)/len(costs)*1000 if costs else 0.0,
+        "event_max_ms": max(costs)*1000 if costs else 0.0,
+        "event_mean_ms_by_type": {name: sum(times)/len(times)*1000 for name, times in by_type.items()},
+        "display_updates": PERF.presents - presents,
+    }
 
 
 def draw_game_start(screen): #Justice Benton - Start Screen last edited 23 Apr 2024
@@ -314,7 +1416,9 @@ def draw_game_start(screen): #Justice Benton - Start Screen last edited 23 Apr 2
     screen.blit(quitSurface, quitRectangle)
 
     while True:
-        for event in pygame.event.get():
+        for event in EVENTS.get():
+            if event.type == pygame.KEYDOWN and event.key == PERF_HUD_KEY:
+                PERF.toggle()
             if event.type == pygame.QUIT:
                 pygame.display.quit() #for some reason, display.quit is necessary. sys.exit won't close the window, and doing so will crash.
                 sys.exit()
@@ -328,7 +1432,8 @@ def draw_game_start(screen): #Justice Benton - Start Screen last edited 23 Apr 2
                 elif quitRectangle.collidepoint(event.pos): #if mouse is on quit button and clicking
                     pygame.display.quit()
                     sys.exit() #take a wild guess
-        pygame.display.update()
+        PERF.present()
+        PERF.end_frame()
 
 #Cell Class
 class Cell: #Justice Benton - Cell Class last edited 25 Apr 2024
@@ -343,6 +1448,7 @@ class Cell: #Justice Benton - Cell Class last edited 25 Apr 2024
         self.screen = screen
         self.mut = mut #mutability. Cells with pre-set or non-sketch values are immutable barring reset. Any cell may still be selected.
         #mut = 2 is unsubmitted, mut = 1 is submitted, mut = 0 is preset.
+        self.marks = 0 #pencil marks as a bitmask, bit d-1 is set when d is a candidate
         
         
     def set_cell_value(self, value):
@@ -354,7 +1460,12 @@ class Cell: #Justice Benton - Cell Class last edited 25 Apr 2024
     def set_sketched_value(self, value):
         #Sketches a cell value. in main, it can't be done to a cell unless cell.mut == 2
         self.value = value
+
+    def toggle_mark(self, value):
+        #Turns the pencil mark for value on or off. Only shown while the cell has no sketched or placed value.
+        self.marks ^= 1 << (value-1)
         
+    @perf_timed("draw")
     def draw(self, sel):
         #takes a new attriute, sel, as a parameter
         self.sel = sel #sel is a boolean that refers to whether the cell is selected or not.
@@ -395,6 +1506,8 @@ class Cell: #Justice Benton - Cell Class last edited 25 Apr 2024
                 if self.value != 0:
                     text = sketchFont.render(str(self.value), 0, LINE_COLOR) #here, the font for the text is notably smaller.
                     border.blit(text, (cell_size/6, cell_size/8)) #The text is on the upper left now.
+                elif self.marks:
+                    border.blit(candidate_atlas(SIZE).surface(self.marks), (cell_size/15, cell_size/15)) #all pencil marks in one blit
                 self.screen.blit(border, (leftBound, upBound)) 
             else:
                 surface = pygame.Surface((cell_size, cell_size))
@@ -402,12 +1515,14 @@ class Cell: #Justice Benton - Cell Class last edited 25 Apr 2024
                 if self.value != 0:
                     text = sketchFont.render(str(self.value), 0, LINE_COLOR) #the sketched value of the cell, as text. Again, usess the smaller text.
                     surface.blit(text, (cell_size/6, cell_size/8)) #places the text onto a black square (the cell) This is small and on the upper left
+                elif self.marks:
+                    surface.blit(candidate_atlas(SIZE).surface(self.marks), (cell_size/15, cell_size/15)) #all pencil marks in one blit
                 self.screen.blit(surface, (leftBound, upBound)) #places the text 
 
 #Board Class
 class Board:
     # Constructor for the Board class to initialize the Sudoku board
-    def __init__(self, rows, cols, width, height, screen, difficulty):
+    def __init__(self, rows, cols, width, height, screen, difficulty, variant=None):
         self.row = 0
         self.col = 0
         self.rows = rows
@@ -418,7 +1533,7 @@ class Board:
         self.difficulty = difficulty  # Difficulty level for the Sudoku puzzle
 
         # Create and set up the Sudoku board
-        self.sudoku = SudokuGenerator(SIZE, removed_cells=difficulty)
+        self.sudoku = SudokuGenerator(SIZE, removed_cells=difficulty, variant=variant) # variant defaults to classic sudoku
         self.sudoku.fill_values()  # Fill the Sudoku with complete numbers
         self.sudoku.remove_cells()  # Remove cells to create a puzzle
 
@@ -428,6 +1543,9 @@ class Board:
         # Calculate the cell size based on the grid dimensions
         #cell_size = self.width // self.cols
 
+        # Peers of every cell, shared with every other board using the same variant
+        self.peers = self.sudoku.variant.peers
+
         # Create a 2D array of Cell objects for the board
         self.cells = [
             [Cell(self.board[i][j], i, j, screen) for j in range(cols)]
@@ -442,6 +1560,7 @@ class Board:
 
     # Draws the Sudoku grid and its cells
     # Draws an outline of the Sudoku grid and each cell on the board
+    @perf_timed("draw")
     def draw(self): #Justice Benton - Board Class GFX Rewrite (nonfunctional prior) last edited 26 Apr 2024
         self.screen.fill(BG_COLOR)  # Fill the background
         
@@ -514,9 +1633,25 @@ class Board:
     def sketch(self, value):
         self.cells[self.row][self.col].set_sketched_value(value)
 
-    # Sets the value of the selected cell
+    # Toggles a pencil mark in the selected cell
+    def toggle_mark(self, value):
+        self.cells[self.row][self.col].toggle_mark(value)
+
+    # Sets the value of the selected cell and removes it from the pencil marks of its row, column and box
+    # Returns the peer cells whose marks changed, so they can be redrawn
     def place_number(self, value):
-        self.cells[self.row][self.col].set_cell_value(value)
+        cell = self.cells[self.row][self.col]
+        cell.set_cell_value(value)
+        cell.marks = 0
+        changed = []
+        if value != 0:
+            bit = 1 << (value-1)
+            for row, col in self.peers[self.row*self.cols + self.col]:
+                peer = self.cells[row][col]
+                if peer.marks & bit:
+                    peer.marks &= ~bit
+                    changed.append(peer)
+        return changed
 
     # Resets the Sudoku board to its original state
     def reset_to_original(self):
@@ -551,15 +1686,8 @@ class Board:
 
     # Checks whether the Sudoku board is solved correctly
     def check_board(self): #Justice Benton - Board Verifier Rewrite (nonfunctional prior) last edited 26 Apr 2024
-        
-        for i in range(SIZE):
-            for j in range(SIZE):
-                temp = self.board[i][j] #placeholder for the current value due to how is_valid works
-                self.board[i][j] = 0 #temporarily sets the val to zero
-                if not self.sudoku.is_valid(i, j, temp): #chacks a cell for validity
-                    return False #if the solution is not valid
-                self.board[i][j] = temp #resets cell value to previous.
-        return True #If the board solution is valid
+        #checks every unit of the board's variant (rows, columns, boxes, and any diagonals or cages) in one pass
+        return self.sudoku.variant.check(self.board) #True if the board solution is valid
 
    
     
@@ -574,7 +1702,7 @@ def main(): #Justice Benton - Main last edited 26 Apr 2024
     
     difficulty = draw_game_start(screen)
     screen.fill(BG_COLOR)
-    pygame.display.update()
+    PERF.present()
     
     boardObj = Board(SIZE, SIZE, WIDTH, HEIGHT, screen, difficulty)
     boardObj.draw()
@@ -621,16 +1749,24 @@ def main(): #Justice Benton - Main last edited 26 Apr 2024
     screen.blit(restartSurface, restartRectangle)
     screen.blit(quitSurface, quitRectangle)
      
-    pygame.display.update()
+    PERF.present()
 
     #looped game part of main function
     while True:
-        for event in pygame.event.get():
+        for event in EVENTS.get():
             
             #Manual quit failsafe
             if event.type == pygame.QUIT:
                 pygame.display.quit()
                 sys.exit()
+
+            if event.type in (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN):
+                PERF.mark_input() #starts the input->present clock for this event
+            #Performance HUD toggle and csv dump
+            if event.type == pygame.KEYDOWN and event.key == PERF_HUD_KEY:
+                PERF.toggle()
+            elif event.type == pygame.KEYDOWN and event.key == PERF_DUMP_KEY:
+                PERF.dump_csv() #the HUD shows where it went
                 
             
             if event.type == pygame.MOUSEBUTTONDOWN: #basically all click actions.
@@ -648,7 +1784,7 @@ def main(): #Justice Benton - Main last edited 26 Apr 2024
                     #re-borders new cell
                     boardObj.select(selRow, selCol)
                     boardObj.cells[selRow][selCol].draw(True)
-                    pygame.display.update()
+                    PERF.present()
                 #This section is for clicking one of the three side buttons
                 
                 if resetRectangle.collidepoint(event.pos): #if reset is clicked
@@ -657,10 +1793,11 @@ def main(): #Justice Benton - Main last edited 26 Apr 2024
                             if boardObj.cells[i][j].mut != 0: #checks the mutability values of every cell to see if they are permanent (0) or not.
                                 boardObj.cells[i][j].value = 0 #If one cell is mutable, resets the cell.
                                 boardObj.cells[i][j].mut = 2 
+                                boardObj.cells[i][j].marks = 0 #and its pencil marks
                                 boardObj.cells[i][j].draw(False) #redraws the cell without a selection border
                     #This redraws the board
                     boardObj.update_board()
-                    pygame.display.update()
+                    PERF.present()
                     
                 elif restartRectangle.collidepoint(event.pos): #if restart is clicked
                     restart = True #sets "restart" to true, which will later end the while True loop, causing the main function to reset.
@@ -669,12 +1806,12 @@ def main(): #Justice Benton - Main last edited 26 Apr 2024
                     pygame.display.quit() #closes the display
                     sys.exit() #closes the application
                     
-                time.sleep(0.01) #buffers inputs for stability
+                PERF.sleep(0.01) #buffers inputs for stability
              
             #For all key inputs
             if event.type == pygame.KEYDOWN and oldSel == [selRow, selCol]:
                 #At some point, I mixed up rows, columns, and logic. It works, so don't mess with it. Consistency > Accuracy. Just be aware when editing.
-                keyInput = pygame.key.get_pressed() #records the key that's pressed
+                keyInput = EVENTS.get_pressed() #records the key that's pressed
                 #Movement inputs. Uses either WASD or arrow keys.
                 if (keyInput[pygame.K_UP] or keyInput[pygame.K_w]) and selCol != 0: #Upwards Movement
                     selCol += -1 #changes the selected column in the direction of movement.
@@ -700,6 +1837,9 @@ def main(): #Justice Benton - Main last edited 26 Apr 2024
                     oldSel = [selRow, selCol]
                     boardObj.select(selRow, selCol)
                     # boardObj.cells[selRow][selCol].draw(True)
+                #Shift + number toggles a pencil mark instead of sketching.
+                elif event.mod & pygame.KMOD_SHIFT and event.key in MARK_KEYS and boardObj.cells[selRow][selCol].mut == 2:
+                    boardObj.toggle_mark(MARK_KEYS[event.key])
                 #Number inputs. At this point, I probably should have used a switch. Oh well.
                 elif (keyInput[pygame.K_1] or keyInput[pygame.K_KP1]) and boardObj.cells[selRow][selCol].mut == 2:
                     boardObj.sketch(1) #Input 1 , all others follow same logic. Reads either numpad or normal number key.
@@ -721,20 +1861,23 @@ def main(): #Justice Benton - Main last edited 26 Apr 2024
                     boardObj.sketch(9)
                 #The Enter button, which writes the values. Reads either numpad or normal enter (return) keys
                 elif (keyInput[pygame.K_RETURN] or keyInput[pygame.K_KP_ENTER]) and boardObj.cells[selRow][selCol].mut == 2:
-                    boardObj.place_number(boardObj.cells[selRow][selCol].value)
+                    for peer in boardObj.place_number(boardObj.cells[selRow][selCol].value):
+                        peer.draw(False) #redraws the peers that just lost a pencil mark
                     boardObj.cells[selRow][selCol].mut = 1
                 #The backspace OR delete key, which deletes the values. Reads either backspace or delete keys.
                 elif(keyInput[pygame.K_BACKSPACE] or keyInput[pygame.K_DELETE]) and boardObj.cells[selRow][selCol].mut != 0:
                     boardObj.cells[selRow][selCol].value = 0
                     boardObj.cells[selRow][selCol].mut = 2
+                    boardObj.cells[selRow][selCol].marks = 0
                 #at the end of every loop, the stored array value for the board is updated
                 boardObj.update_board()
                 #Then, the image to display is updated. Technically, there can be issues with only updating the selected value.
                 #To try and mitigate issues, a delay (sleep) is used further below to limit issues.
                 boardObj.cells[selRow][selCol].draw(True)
                 #Finally, the screen is properly updated.
-                pygame.display.update()
-                time.sleep(0.01) #stability buffer
+                PERF.present()
+                PERF.sleep(0.01) #stability buffer
+        PERF.end_frame()
         if restart: #If restart is true from the restart button, ends the while loop, effectively resetting main.
             break
         #This section checks to see if the board is fully filled.
@@ -779,20 +1922,47 @@ def main(): #Justice Benton - Main last edited 26 Apr 2024
         titleSurface = lossTitleFont.render("You Lost....", 0, LINE_COLOR)
         titleRectangle = titleSurface.get_rect(center =(WIDTH/2,HEIGHT*(300-180)/600))
         screen.blit(titleSurface, titleRectangle)
-    pygame.display.update() #updates the screen.
+    PERF.present() #updates the screen.
 
     while True: #looping for the win/loss screen. Basically, keeps the screen there until restart is hit.
-        for event in pygame.event.get():
+        for event in EVENTS.get():
             if event.type == pygame.QUIT: #Manual quit failsafe
                 pygame.display.quit()
                 sys.exit()
+            if event.type in (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN):
+                PERF.mark_input()
+            #Performance HUD toggle and csv dump, same as in the game
+            if event.type == pygame.KEYDOWN and event.key == PERF_HUD_KEY:
+                PERF.toggle()
+            elif event.type == pygame.KEYDOWN and event.key == PERF_DUMP_KEY:
+                PERF.dump_csv()
             if event.type == pygame.MOUSEBUTTONDOWN: #basically all click actions.
                 if restartRectangle.collidepoint(event.pos): #if restart is clicked
                     restart = True #sets "restart" to true, which will later end the while True loop, causing the main function to reset.
+        PERF.end_frame()
         if restart: #If restart is true from the restart button, ends the while loop, effectively resetting main.
             break
     
 #main here
 if __name__ == "__main__":
+    if "--benchmark" in sys.argv: #python sudoku_generator.py --benchmark, compares the fill strategies instead of starting the game
+        for size, timings in benchmark_fill_strategies().items():
+            print(size, " ".join(f"{name}={'timeout' if t is None else f'{t*1000:.3f}ms'}" for name, t in timings.items()))
+        print("pattern mixing (9x9):", check_mixing())
+        sys.exit()
+    if "--check-mixing" in sys.argv: #python sudoku_generator.py --check-mixing, exits with an error if the pattern boards aren't well mixed
+        print(check_mixing())
+        sys.exit()
+    if "--perf-csv" in sys.argv: #python sudoku_generator.py --perf-csv session.csv, dumps the frame samples and input latencies when the game exits
+        atexit.register(PERF.dump_csv, sys.argv[sys.argv.index("--perf-csv")+1])
+    if "--replay" in sys.argv: #python sudoku_generator.py --replay session.jsonl, headless performance run of a recording
+        report = run_replay(sys.argv[sys.argv.index("--replay")+1])
+        for name, value in report.items():
+            print(f"{name}: {value}")
+        sys.exit()
+    if "--record" in sys.argv: #python sudoku_generator.py --record session.jsonl, plays normally and records the inputs
+        EVENTS = EventRecorder(sys.argv[sys.argv.index("--record")+1])
+    if "--perf" in sys.argv: #starts with the HUD showing
+        PERF.visible = True
     while True:
         main()
@@ -0,0 +1,105 @@
+import os
+import random
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy") #no window needed, must be set before pygame starts a display
+
+import pygame
+import sudoku_generator
+from sudoku_generator import PerfMonitor, SudokuGenerator, VerificationService, check_mixing
+
+
+def unshuffled_pattern(self):
+    #fill_pattern with only the digit relabelling, no row/band/column/stack shuffles
+    box = self.box_length
+    side = self.row_length
+    digits = random.sample(range(1, side+1), side)
+    for row in range(side):
+        self.board[row] = [digits[(box*(row%box) + row//box + col) % side] for col in range(side)]
+
+
+class TestPatternMixing(unittest.TestCase):
+    def test_pattern_boards_are_well_mixed(self):
+        stats = check_mixing(9, samples=1000)
+        self.assertLessEqual(stats["pair_t"], 6.0)
+
+    def test_pattern_boards_are_well_mixed_16(self):
+        check_mixing(16, samples=400)
+
+    def test_missing_structural_shuffles_fail(self):
+        with mock.patch.object(SudokuGenerator, "fill_pattern", unshuffled_pattern):
+            with self.assertRaises(AssertionError):
+                check_mixing(9, samples=1000)
+
+    def test_check_leaves_random_state_alone(self):
+        state = random.getstate()
+        check_mixing(4, samples=200, min_unique=0.0) #4x4 only has a handful of distinct shapes
+        self.assertEqual(random.getstate(), state)
+
+
+
+class TestPerfLatency(unittest.TestCase):
+    def setUp(self):
+        pygame.display.init()
+        pygame.display.set_mode((10, 10))
+
+    def tearDown(self):
+        pygame.display.quit()
+
+    def test_input_without_present_is_not_charged_with_idle_time(self):
+        perf = PerfMonitor()
+        perf.mark_input() #e.g. a click on empty side-panel space, nothing gets redrawn
+        perf.end_frame()
+        for i in range(50): #about 0.2s of idle busy-loop passes
+            time.sleep(0.004)
+            perf.end_frame()
+        perf.mark_input() #a key that does redraw
+        perf.present()
+        perf.end_frame()
+        latencies = [latency for queued, latency in perf.latencies]
+        self.assertEqual(len(latencies), 2)
+        self.assertIsNone(latencies[0])
+        self.assertLess(latencies[1], 100)
+        self.assertLess(perf.summary()["latency_max_ms"], 100)
+
+    def test_idle_passes_are_folded_into_the_next_frame(self):
+        perf = PerfMonitor()
+        for i in range(100):
+            perf.end_frame()
+        self.assertEqual(len(perf.samples), 0)
+        perf.present()
+        perf.end_frame()
+        self.assertEqual(len(perf.samples), 1)
+        self.assertEqual(perf.samples[0][PerfMonitor.CSV_HEADER.index("idle_passes")], 100)
+
+
+class TestVerificationService(unittest.TestCase):
+    def setUp(self):
+        generator = SudokuGenerator(9, 0, "pattern")
+        generator.fill_values()
+        self.good = generator.get_board()
+        self.bad = [row[:] for row in self.good]
+        self.bad[0][0], self.bad[0][1] = self.bad[0][1], self.bad[0][0]
+
+    def test_repeats_in_a_batch_are_counted(self):
+        with VerificationService() as service:
+            verdicts = service.verify_batch([self.good, self.good, self.bad, self.good])
+            self.assertEqual([verdict.valid for verdict in verdicts], [True, True, False, True])
+            stats = service.stats()
+            self.assertEqual((stats["hits"], stats["misses"], stats["deduplicated"], stats["verified"]), (0, 2, 2, 2))
+            service.verify_batch([self.bad])
+            self.assertEqual(service.stats()["hits"], 1)
+            self.assertEqual(service.stats()["saved_rate"], 0.6)
+
+    def test_out_of_range_values_are_rejected(self):
+        board = [row[:] for row in self.good]
+        board[4][4] = 256
+        with VerificationService() as service:
+            with self.assertRaises(ValueError):
+                service.verify_batch([board])
+
+
+if __name__ == "__main__":
+    unittest.main()